@@ -10,20 +10,49 @@
 # distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
+import codecs
+import contextlib
+import io
 import logging
+import os
+import re
+from operator import itemgetter
 
 from botocore.compat import json
 
-from botocore.utils import set_value_from_jmespath
+from botocore.utils import merge_dicts, set_value_from_jmespath
 from botocore.paginate import PageIterator
 
-from awscli.table import MultiTable, Styler, ColorizedStyler
 from awscli import text
 from awscli import compat
 from awscli.utils import json_encoder
 
 
 LOG = logging.getLogger(__name__)
+# Size of the write buffer used when stdout is unbuffered or line buffered.
+_OUTPUT_BUFFER_SIZE = 64 * 1024
+# Output that orjson writes differently than the stdlib json module is
+# left to the stdlib.  That is floats written with an exponent (1e16
+# instead of 1e+16), floats in [1e-05, 1e-04) that orjson writes in fixed
+# notation (0.000035 instead of 3.5e-05), and null, which is also how
+# orjson writes NaN and Infinity.  Every value in the indented output
+# ends its line and a line ending with a string ends with a quote, so
+# strings never match.  Each pattern starts with a literal so the search
+# runs at C speed, which a single alternation does not.
+_ORJSON_FALLBACK_RES = (
+    re.compile(br'e-?[0-9]+,?\n'),
+    re.compile(br'0\.0000[0-9]*,?\n'),
+    re.compile(br'null,?\n'),
+)
+_SIMPLE_IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# How the result key's list is closed in the json-stream output.
+_LIST_END = '\n    ]'
+# Values of these types are written out directly by _SCALAR_ENCODER, which
+# is created once so that each value does not pay for building an encoder.
+_JSON_SCALAR_TYPES = (str, int, float, bool)
+_SCALAR_ENCODER = json.JSONEncoder(ensure_ascii=False)
+# Values of these types are rendered as nested tables rather than as cells.
+_NON_SCALAR_TYPES = (list, dict)
 
 
 def is_response_paginated(response):
@@ -33,13 +62,22 @@ def is_response_paginated(response):
 class Formatter(object):
     def __init__(self, args):
         self._args = args
+        self._query = getattr(args, 'query', None)
 
     def _remove_request_id(self, response_data):
-        if 'ResponseMetadata' in response_data:
-            if 'RequestId' in response_data['ResponseMetadata']:
-                request_id = response_data['ResponseMetadata']['RequestId']
-                LOG.debug('RequestId: %s', request_id)
-            del response_data['ResponseMetadata']
+        if not isinstance(response_data, dict):
+            return
+        response_metadata = response_data.pop('ResponseMetadata', None)
+        if response_metadata and 'RequestId' in response_metadata:
+            LOG.debug('RequestId: %s', response_metadata['RequestId'])
+
+    def _get_transformed_response_for_output(self, response_data,
+                                             skip_response_metadata=False):
+        if not skip_response_metadata:
+            self._remove_request_id(response_data)
+        if self._query is not None:
+            return self._query.search(response_data)
+        return response_data
 
     def _get_default_stream(self):
         return compat.get_stdout_text_writer()
@@ -50,6 +88,50 @@ class Formatter(object):
         except IOError:
             pass
 
+    def _get_page_flusher(self, stream):
+        # Paginated output is flushed after every page when it is written
+        # to a terminal so results show up as they are retrieved.
+        # Otherwise the stream's buffer decides when to write, and the
+        # final flush happens once all the pages have been formatted.
+        try:
+            is_tty = stream.isatty()
+        except (AttributeError, ValueError, IOError):
+            # The stream may not implement isatty(), may already be
+            # closed, or its file descriptor may no longer be valid.
+            is_tty = False
+        if is_tty:
+            return stream.flush
+        return lambda: None
+
+    @contextlib.contextmanager
+    def _buffered_stream(self, stream):
+        # The formatters issue many small writes.  If stdout is
+        # unbuffered (python -u) or line buffered (a tty), each of those
+        # writes is a separate syscall, so we batch them in a larger buffer
+        # that is flushed once we are done writing.  Only plain text
+        # wrappers are rewrapped so that anything wrapping stdout
+        # (e.g. colorama on windows) keeps seeing our writes.
+        if not isinstance(stream, io.TextIOWrapper) or not (
+                stream.line_buffering or
+                isinstance(stream.buffer, io.RawIOBase)):
+            yield stream
+            return
+        stream.flush()
+        buffered = io.TextIOWrapper(
+            io.BufferedWriter(stream.buffer, buffer_size=_OUTPUT_BUFFER_SIZE),
+            encoding=stream.encoding, errors=stream.errors,
+            write_through=False)
+        try:
+            yield buffered
+        finally:
+            try:
+                # Detach so that the original stdout buffer is not closed
+                # when the wrappers are garbage collected.
+                buffered.detach().detach()
+            except (IOError, ValueError):
+                pass
+            self._flush_stream(stream)
+
 
 class FullyBufferedFormatter(Formatter):
     def __call__(self, command_name, response, stream=None):
@@ -61,36 +143,262 @@ class FullyBufferedFormatter(Formatter):
         # I think the interfaces between non-paginated
         # and paginated responses can still be cleaned up.
         if is_response_paginated(response):
+            # build_full_result only contains the result keys and non
+            # aggregate keys, so there is no response metadata to remove.
             response_data = response.build_full_result()
+            skip_response_metadata = True
         else:
             response_data = response
-        self._remove_request_id(response_data)
-        if self._args.query is not None:
-            response_data = self._args.query.search(response_data)
-        try:
-            self._format_response(command_name, response_data, stream)
-        except IOError as e:
-            # If the reading end of our stdout stream has closed the file
-            # we can just exit.
-            pass
-        finally:
-            # flush is needed to avoid the "close failed in file object
-            # destructor" in python2.x (see http://bugs.python.org/issue11380).
-            self._flush_stream(stream)
+            skip_response_metadata = False
+        response_data = self._get_transformed_response_for_output(
+            response_data, skip_response_metadata=skip_response_metadata)
+        with self._buffered_stream(stream) as stream:
+            try:
+                self._format_response(command_name, response_data, stream)
+            except IOError as e:
+                # If the reading end of our stdout stream has closed the file
+                # we can just exit.
+                pass
+            finally:
+                # flush is needed to avoid the "close failed in file object
+                # destructor" in python2.x
+                # (see http://bugs.python.org/issue11380).
+                self._flush_stream(stream)
 
 
 class JSONFormatter(FullyBufferedFormatter):
+    # JSONEncoder keeps no state between calls, so one is reused for
+    # every document.
+    _ENCODER = json.JSONEncoder(indent=4, default=json_encoder,
+                                ensure_ascii=False)
+
+    def __init__(self, args):
+        super(JSONFormatter, self).__init__(args)
+        # orjson is optional and only used for JSON output, so it is not
+        # imported until a JSON formatter is created.
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        self._orjson = orjson
 
     def _format_response(self, command_name, response, stream):
         # For operations that have no response body (e.g. s3 put-object)
         # the response will be an empty string.  We don't want to print
         # that out to the user but other "falsey" values like an empty
         # dictionary should be printed.
-        if response != {}:
-            json.dump(response, stream, indent=4, default=json_encoder,
-                    ensure_ascii=False)
+        if not _is_empty_dict(response):
+            self._write_json(response, stream)
             stream.write('\n')
 
+    def _write_json(self, value, stream, indent_level=0):
+        # Write value as indented JSON.  A non zero indent_level indents
+        # every line after the first so the value can be nested inside
+        # an enclosing document that is written separately.
+        if indent_level or value is None or isinstance(
+                value, _JSON_SCALAR_TYPES):
+            stream.write(self._encode_json(value, indent_level))
+            return
+        serialized = self._serialize_with_orjson(value)
+        if serialized is None:
+            # Write the chunks as they are encoded rather than
+            # building the entire document as a single string.
+            write = stream.write
+            for chunk in self._ENCODER.iterencode(value):
+                write(chunk)
+            return
+        buffer = getattr(stream, 'buffer', None)
+        if (buffer is not None and os.linesep == '\n' and
+                self._is_utf8_stream(stream)):
+            # Skip the text layer entirely.  Anything already written to
+            # the text layer has to be flushed first to preserve ordering.
+            # This is only done where the text layer would not translate
+            # newlines (it does on windows).
+            stream.flush()
+            buffer.write(serialized)
+        else:
+            stream.write(serialized.decode('utf-8'))
+
+    def _encode_json(self, value, indent_level=0):
+        if value is None or isinstance(value, _JSON_SCALAR_TYPES):
+            # Scalars serialize the same regardless of indentation, so
+            # they can skip the indentation handling entirely.
+            return _SCALAR_ENCODER.encode(value)
+        serialized = self._serialize_with_orjson(value)
+        if serialized is None:
+            encoded = self._dumps(value)
+        else:
+            encoded = serialized.decode('utf-8')
+        if indent_level:
+            encoded = encoded.replace('\n', '\n' + '    ' * indent_level)
+        return encoded
+
+    def _dumps(self, value):
+        return self._ENCODER.encode(value)
+
+    def _serialize_with_orjson(self, value):
+        orjson = self._orjson
+        if orjson is None:
+            return None
+        try:
+            # Datetimes are passed through to json_encoder so they are
+            # formatted the same way as with the stdlib json module.
+            serialized = orjson.dumps(
+                value, default=json_encoder,
+                option=(orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS |
+                        orjson.OPT_PASSTHROUGH_DATETIME))
+        except orjson.JSONEncodeError:
+            # Let the stdlib json module handle anything orjson
+            # does not support (e.g. integers larger than 64 bits).
+            return None
+        for fallback_re in _ORJSON_FALLBACK_RES:
+            if fallback_re.search(serialized) is not None:
+                return None
+        return _double_indentation(serialized)
+
+    def _is_utf8_stream(self, stream):
+        encoding = getattr(stream, 'encoding', None)
+        if not encoding:
+            return False
+        try:
+            return codecs.lookup(encoding).name == 'utf-8'
+        except LookupError:
+            return False
+
+
+class StreamedJSONFormatter(JSONFormatter):
+    """Write paginated JSON output as each page is retrieved.
+
+    The paginated output has the same structure as the ``json`` output,
+    but the items of the primary result key are written out page by page
+    instead of first aggregating every page with ``build_full_result``,
+    so memory usage does not grow with the number of items.  Responses
+    that cannot be streamed (non paginated responses, a ``--query``
+    expression, or a nested primary result key) are formatted exactly like
+    ``JSONFormatter`` formats them.  If another result key is returned
+    before the primary one, the primary key is aggregated as well so the
+    keys keep the same order as the ``json`` output.
+
+    """
+    def __call__(self, command_name, response, stream=None):
+        if not self._can_stream(response):
+            return super(StreamedJSONFormatter, self).__call__(
+                command_name, response, stream)
+        if stream is None:
+            stream = self._get_default_stream()
+        with self._buffered_stream(stream) as stream:
+            try:
+                self._stream_response(command_name, response, stream)
+            except IOError:
+                # If the reading end of our stdout stream has closed the file
+                # we can just exit.
+                pass
+            finally:
+                self._flush_stream(stream)
+
+    def _can_stream(self, response):
+        # A query may need to see the complete result, so only the
+        # unfiltered output can be streamed.
+        return (
+            is_response_paginated(response) and
+            self._query is None and
+            _is_simple_identifier(response.result_keys[0].expression)
+        )
+
+    def _stream_response(self, command_name, response, stream):
+        primary_key = response.result_keys[0]
+        remaining_keys = response.result_keys[1:]
+        # The primary result key is written as it is retrieved.  Any other
+        # result keys are aggregated the same way build_full_result does
+        # and written after it along with the non aggregate keys.  The
+        # primary key is only written first if build_full_result would
+        # put it first, i.e. it is a list and no other result key came
+        # before it.  Otherwise it is aggregated along with the rest.
+        remaining = {}
+        started = False
+        num_items = 0
+        flush_page = self._get_page_flusher(stream)
+        for page in response:
+            items = primary_key.search(page)
+            if isinstance(items, list) and (started or not remaining):
+                if not started:
+                    stream.write('{\n    %s: [' % self._dumps(
+                        primary_key.expression))
+                    started = True
+                if items:
+                    # Serialize the whole page in one call rather than
+                    # one call per item, then drop the enclosing brackets
+                    # since the list continues across pages.
+                    encoded = self._encode_json(items, indent_level=1)
+                    if num_items:
+                        stream.write(',')
+                    stream.write(encoded[1:-len(_LIST_END)])
+                    num_items += len(items)
+                flush_page()
+            elif not started:
+                # Once the list has been started any non list value is
+                # dropped, build_full_result can't combine it with the
+                # list either.
+                _merge_result_value(remaining, primary_key, items)
+            for result_key in remaining_keys:
+                _merge_result_value(
+                    remaining, result_key, result_key.search(page))
+        merge_dicts(remaining, response.non_aggregate_part)
+        if response.resume_token is not None:
+            remaining['NextToken'] = response.resume_token
+        if not started:
+            self._format_response(command_name, remaining, stream)
+            return
+        stream.write(_LIST_END if num_items else ']')
+        for key, value in remaining.items():
+            stream.write(',\n    %s: ' % self._dumps(key))
+            self._write_json(value, stream, indent_level=1)
+        stream.write('\n}\n')
+
+
+def _double_indentation(serialized):
+    # orjson only supports two space indentation.  JSON strings can never
+    # contain a literal newline, so every line starts with its structural
+    # indentation followed by a non space character.  Working from the
+    # deepest level up, each level's indentation is replaced with one NUL
+    # byte per level (NUL can't appear unescaped in JSON), which stops
+    # shallower levels from matching it again.  The NUL bytes then become
+    # the four space indentation of the stdlib json module.  Each step is
+    # a single bytes.replace, so this all runs in C.
+    depth = 0
+    while b'\n' + b'  ' * (depth + 1) in serialized:
+        depth += 1
+    if not depth:
+        return serialized
+    for level in range(depth, 0, -1):
+        serialized = serialized.replace(
+            b'\n' + b'  ' * level, b'\n' + b'\0' * level)
+    return serialized.replace(b'\0', b'    ')
+
+
+def _is_empty_dict(value):
+    return isinstance(value, dict) and not value
+
+
+def _is_simple_identifier(expression):
+    return _SIMPLE_IDENTIFIER_RE.fullmatch(expression) is not None
+
+
+def _merge_result_value(result, result_key, value):
+    # Add the value of a result key from a single page to the aggregated
+    # result.  This mirrors how PageIterator.build_full_result combines
+    # pages.
+    if value is None:
+        return
+    existing_value = result_key.search(result)
+    if existing_value is None:
+        set_value_from_jmespath(result, result_key.expression, value)
+    elif isinstance(value, list):
+        existing_value.extend(value)
+    elif isinstance(value, (int, float, str)):
+        set_value_from_jmespath(
+            result, result_key.expression, existing_value + value)
+
 
 class TableFormatter(FullyBufferedFormatter):
     """Pretty print a table from a given response.
@@ -101,6 +409,9 @@ class TableFormatter(FullyBufferedFormatter):
 
     """
     def __init__(self, args, table=None):
+        # The table module (and colorama) is only needed for table
+        # output, so it is not imported until a table formatter is created.
+        from awscli.table import MultiTable, Styler, ColorizedStyler
         super(TableFormatter, self).__init__(args)
         if args.color == 'auto':
             self.table = MultiTable(initial_section=False,
@@ -136,9 +447,10 @@ class TableFormatter(FullyBufferedFormatter):
                 self._build_sub_table_from_list(current, indent_level, title)
             else:
                 for item in current:
-                    if self._scalar_type(item):
+                    if not isinstance(item, _NON_SCALAR_TYPES):
                         self.table.add_row([item])
-                    elif all(self._scalar_type(el) for el in item):
+                    elif not any(isinstance(el, _NON_SCALAR_TYPES)
+                                 for el in item):
                         self.table.add_row(item)
                     else:
                         self._build_table(title=None, current=item)
@@ -156,27 +468,35 @@ class TableFormatter(FullyBufferedFormatter):
         headers, more = self._group_scalar_keys(current)
         if len(headers) == 1:
             # Special casing if a dict has a single scalar key/value pair.
-            self.table.add_row([headers[0], current[headers[0]]])
+            header = headers[0]
+            self.table.add_row((header, current[header]))
         elif headers:
             self.table.add_row_header(headers)
-            self.table.add_row([current[k] for k in headers])
+            self.table.add_row(self._get_row_getter(headers)(current))
         for remaining in more:
             self._build_table(remaining, current[remaining],
                               indent_level=indent_level + 1)
 
     def _build_sub_table_from_list(self, current, indent_level, title):
         headers, more = self._group_scalar_keys_from_list(current)
-        self.table.add_row_header(headers)
+        add_row = self.table.add_row
+        add_row_header = self.table.add_row_header
+        get_row = self._get_row_getter(headers)
+        add_row_header(headers)
         first = True
         for element in current:
             if not first and more:
                 self.table.new_section(title,
                                        indent_level=indent_level)
-                self.table.add_row_header(headers)
+                add_row_header(headers)
             first = False
-            # Use .get() to account for the fact that sometimes an element
-            # may not have all the keys from the header.
-            self.table.add_row([element.get(header, '') for header in headers])
+            try:
+                row = get_row(element)
+            except KeyError:
+                # Use .get() to account for the fact that sometimes an
+                # element may not have all the keys from the header.
+                row = [element.get(header, '') for header in headers]
+            add_row(row)
             for remaining in more:
                 # Some of the non scalar attributes may not necessarily
                 # be in every single element of the list, so we need to
@@ -185,22 +505,37 @@ class TableFormatter(FullyBufferedFormatter):
                     self._build_table(remaining, element[remaining],
                                     indent_level=indent_level + 1)
 
-    def _scalar_type(self, element):
-        return not isinstance(element, (list, dict))
+    def _get_row_getter(self, headers):
+        # itemgetter builds the row in C, but only returns a tuple when
+        # it is given more than one key.
+        if len(headers) > 1:
+            return itemgetter(*headers)
+        elif headers:
+            header = headers[0]
+            return lambda element: (element[header],)
+        return lambda element: ()
 
     def _group_scalar_keys_from_list(self, list_of_dicts):
         # We want to make sure we catch all the keys in the list of dicts.
         # Most of the time each list element has the same keys, but sometimes
         # a list element will have keys not defined in other elements.
+        # This is done in a single pass over all the items, sorting only
+        # once at the end rather than once per item.
         headers = set()
         more = set()
+        add_header = headers.add
+        add_more = more.add
         for item in list_of_dicts:
-            current_headers, current_more = self._group_scalar_keys(item)
-            headers.update(current_headers)
-            more.update(current_more)
-        headers = list(sorted(headers))
-        more = list(sorted(more))
-        return headers, more
+            if not item:
+                # Only the first element is known to be a dict, an empty
+                # list element simply has no keys.
+                continue
+            for key, value in item.items():
+                if isinstance(value, _NON_SCALAR_TYPES):
+                    add_more(key)
+                else:
+                    add_header(key)
+        return sorted(headers), sorted(more)
 
     def _group_scalar_keys(self, current):
         # Given a dict, separate the keys into those whose values are
@@ -208,11 +543,11 @@ class TableFormatter(FullyBufferedFormatter):
         # one is the scalar value keys, the second is the remaining keys.
         more = []
         headers = []
-        for element in current:
-            if self._scalar_type(current[element]):
-                headers.append(element)
+        for key, value in current.items():
+            if isinstance(value, _NON_SCALAR_TYPES):
+                more.append(key)
             else:
-                more.append(element)
+                headers.append(key)
         headers.sort()
         more.sort()
         return headers, more
@@ -223,47 +558,82 @@ class TextFormatter(Formatter):
     def __call__(self, command_name, response, stream=None):
         if stream is None:
             stream = self._get_default_stream()
-        try:
-            if is_response_paginated(response):
-                result_keys = response.result_keys
-                for i, page in enumerate(response):
-                    if i > 0:
-                        current = {}
-                    else:
-                        current = response.non_aggregate_part
-
-                    for result_key in result_keys:
-                        data = result_key.search(page)
-                        set_value_from_jmespath(
-                            current,
-                            result_key.expression,
-                            data
-                        )
-                    self._format_response(current, stream)
-                if response.resume_token:
-                    # Tell the user about the next token so they can continue
-                    # if they want.
-                    self._format_response(
-                        {'NextToken': {'NextToken': response.resume_token}},
-                        stream)
-            else:
-                self._remove_request_id(response)
-                self._format_response(response, stream)
-        finally:
-            # flush is needed to avoid the "close failed in file object
-            # destructor" in python2.x (see http://bugs.python.org/issue11380).
-            self._flush_stream(stream)
+        with self._buffered_stream(stream) as stream:
+            try:
+                self._format_paginated_or_full_response(response, stream)
+            finally:
+                # flush is needed to avoid the "close failed in file object
+                # destructor" in python2.x
+                # (see http://bugs.python.org/issue11380).
+                self._flush_stream(stream)
+
+    def _format_paginated_or_full_response(self, response, stream):
+        emit = self._get_response_emitter(stream)
+        if is_response_paginated(response):
+            flush_page = self._get_page_flusher(stream)
+            for current in self._get_response_stream(response):
+                emit(current)
+                flush_page()
+            if response.resume_token:
+                # Tell the user about the next token so they can continue
+                # if they want.
+                emit({'NextToken': {'NextToken': response.resume_token}})
+        else:
+            self._remove_request_id(response)
+            emit(response)
+
+    def _get_response_stream(self, response):
+        # Generate the output for each page of a paginated response.  The
+        # non aggregate keys are only known once the first page has been
+        # retrieved and are only included in the first page's output.
+        # Most result keys are a single identifier, which can be assigned
+        # directly instead of going through set_value_from_jmespath.
+        result_keys = [
+            (result_key.expression, result_key.search,
+             _is_simple_identifier(result_key.expression))
+            for result_key in response.result_keys
+        ]
+        set_value = set_value_from_jmespath
+
+        def get_page_output(current, page):
+            for expression, search, is_simple in result_keys:
+                if is_simple:
+                    current[expression] = search(page)
+                else:
+                    set_value(current, expression, search(page))
+            return current
+
+        pages = iter(response)
+        for page in pages:
+            yield get_page_output(response.non_aggregate_part, page)
+            break
+        for page in pages:
+            yield get_page_output({}, page)
+
+    def _get_response_emitter(self, stream):
+        # This is called once per page, so the query lookup is resolved
+        # up front instead of on every call.
+        format_text = text.format_text
+        query = self._query
+        if query is None:
+            def emit(response):
+                format_text(response, stream)
+        else:
+            search = query.search
+
+            def emit(response):
+                format_text(search(response), stream)
+        return emit
 
     def _format_response(self, response, stream):
-        if self._args.query is not None:
-            expression = self._args.query
-            response = expression.search(response)
-        text.format_text(response, stream)
+        self._get_response_emitter(stream)(response)
 
 
 def get_formatter(format_type, args):
     if format_type == 'json':
         return JSONFormatter(args)
+    elif format_type == 'json-stream':
+        return StreamedJSONFormatter(args)
     elif format_type == 'text':
         return TextFormatter(args)
     elif format_type == 'table':
@@ -10,14 +10,21 @@
 # distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
-from awscli.compat import six
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 
-def format_text(data, stream):
+# Values of these types are formatted recursively, everything else is
+# written out as a scalar.  The tuple is built once here since it is
+# checked for every value that is formatted.
+_NON_SCALAR_TYPES = (dict, list)
+
+
+def format_text(data: Any, stream: Any) -> None:
     _format_text(data, stream)
 
 
-def _format_text(item, stream, identifier=None, scalar_keys=None):
+def _format_text(item: Any, stream: Any, identifier: Optional[str] = None,
+                 scalar_keys: Optional[List[Any]] = None) -> None:
     if isinstance(item, dict):
         _format_dict(scalar_keys, item, identifier, stream)
     elif isinstance(item, list):
@@ -25,11 +32,12 @@ def _format_text(item, stream, identifier=None, scalar_keys=None):
     else:
         # If it's not a list or a dict, we just write the scalar
         # value out directly.
-        stream.write(six.text_type(item))
+        stream.write(str(item))
         stream.write('\n')
 
 
-def _format_list(item, identifier, stream):
+def _format_list(item: List[Any], identifier: Optional[str],
+                 stream: Any) -> None:
     if not item:
         return
     if any(isinstance(el, dict) for el in item):
@@ -48,29 +56,31 @@ def _format_list(item, identifier, stream):
         _format_scalar_list(item, identifier, stream)
 
 
-def _partition_list(item):
-    scalars = []
-    non_scalars = []
+def _partition_list(item: List[Any]) -> Tuple[List[Any], List[Any]]:
+    scalars: List[Any] = []
+    non_scalars: List[Any] = []
     for element in item:
-        if isinstance(element, (list, dict)):
+        if isinstance(element, _NON_SCALAR_TYPES):
             non_scalars.append(element)
         else:
             scalars.append(element)
     return scalars, non_scalars
 
 
-def _format_scalar_list(elements, identifier, stream):
+def _format_scalar_list(elements: List[Any], identifier: Optional[str],
+                        stream: Any) -> None:
     if identifier is not None:
         for item in elements:
             stream.write('%s\t%s\n' % (identifier.upper(),
                                        item))
     else:
         # For a bare list, just print the contents.
-        stream.write('\t'.join([six.text_type(item) for item in elements]))
+        stream.write('\t'.join([str(item) for item in elements]))
         stream.write('\n')
 
 
-def _format_dict(scalar_keys, item, identifier, stream):
+def _format_dict(scalar_keys: Optional[List[Any]], item: Dict[Any, Any],
+                 identifier: Optional[str], stream: Any) -> None:
     scalars, non_scalars = _partition_dict(item, scalar_keys=scalar_keys)
     if scalars:
         if identifier is not None:
@@ -82,35 +92,37 @@ def _format_dict(scalar_keys, item, identifier, stream):
                      identifier=new_identifier)
 
 
-def _all_scalar_keys(list_of_dicts):
-    keys_seen = set()
+def _all_scalar_keys(list_of_dicts: List[Any]) -> List[Any]:
+    keys_seen: Set[Any] = set()
     for item_dict in list_of_dicts:
         for key, value in item_dict.items():
-            if not isinstance(value, (dict, list)):
+            if not isinstance(value, _NON_SCALAR_TYPES):
                 keys_seen.add(key)
     return list(sorted(keys_seen))
 
 
-def _partition_dict(item_dict, scalar_keys):
+def _partition_dict(
+        item_dict: Dict[Any, Any], scalar_keys: Optional[List[Any]]
+) -> Tuple[List[str], List[Tuple[Any, Any]]]:
     # Given a dictionary, partition it into two list based on the
     # values associated with the keys.
     # {'foo': 'scalar', 'bar': 'scalar', 'baz': ['not, 'scalar']}
     # scalar = [('foo', 'scalar'), ('bar', 'scalar')]
     # non_scalar = [('baz', ['not', 'scalar'])]
-    scalar = []
-    non_scalar = []
+    scalar: List[str] = []
+    non_scalar: List[Tuple[Any, Any]] = []
     if scalar_keys is None:
         # scalar_keys can have more than just the keys in the item_dict,
         # but if user does not provide scalar_keys, we'll grab the keys
         # from the current item_dict
         for key, value in sorted(item_dict.items()):
-            if isinstance(value, (dict, list)):
+            if isinstance(value, _NON_SCALAR_TYPES):
                 non_scalar.append((key, value))
             else:
-                scalar.append(six.text_type(value))
+                scalar.append(str(value))
     else:
         for key in scalar_keys:
-            scalar.append(six.text_type(item_dict.get(key, '')))
+            scalar.append(str(item_dict.get(key, '')))
         remaining_keys = sorted(set(item_dict.keys()) - set(scalar_keys))
         for remaining_key in remaining_keys:
             non_scalar.append((remaining_key, item_dict[remaining_key]))
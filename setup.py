@@ -71,6 +71,20 @@ setup_options = dict(
 )
 
 
+if os.environ.get('AWSCLI_BUILD_MYPYC') == '1':
+    # Optionally compile the modules that do most of the work when
+    # formatting output into C extensions with mypyc.  The pure python
+    # modules are still what gets used if mypyc is not installed.
+    try:
+        from mypyc.build import mypycify
+    except ImportError:
+        sys.stderr.write(
+            'AWSCLI_BUILD_MYPYC is set but mypyc is not installed, '
+            'skipping compilation.\n')
+    else:
+        setup_options['ext_modules'] = mypycify(['awscli/text.py'])
+
+
 if 'py2exe' in sys.argv:
     # This will actually give us a py2exe command.
     import py2exe
@@ -0,0 +1,54 @@
+# Copyright 2012-2013 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+import io
+
+import jmespath
+from botocore.paginate import PageIterator
+
+
+class RecordingRawStream(io.RawIOBase):
+    def __init__(self, is_tty=False):
+        self.writes = []
+        self.is_tty = is_tty
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return self.is_tty
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return len(data)
+
+    def getvalue(self):
+        return b''.join(self.writes)
+
+
+def make_page_iterator(pages, result_keys):
+    # Pages are linked by a Marker and IsTruncated, the way most
+    # paginated operations are.
+    pages = iter(pages)
+    return PageIterator(
+        lambda **kwargs: next(pages),
+        input_token=['Marker'],
+        output_token=[jmespath.compile('Marker')],
+        more_results=jmespath.compile('IsTruncated'),
+        result_keys=[jmespath.compile(key) for key in result_keys],
+        non_aggregate_keys=[],
+        limit_key='MaxItems',
+        max_items=None,
+        starting_token=None,
+        page_size=None,
+        op_kwargs={},
+    )
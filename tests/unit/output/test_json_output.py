@@ -11,14 +11,25 @@
 # distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
+import copy
+import datetime
+import io
+
 from botocore.compat import json
 import platform
 from awscli.compat import six
-from awscli.formatter import JSONFormatter
+from awscli.formatter import JSONFormatter, StreamedJSONFormatter
+from awscli.utils import json_encoder
 
 from awscli.testutils import BaseAWSCommandParamsTest, unittest
 from awscli.testutils import mock, skip_if_windows
 from awscli.compat import get_stdout_text_writer
+from tests.unit.output import RecordingRawStream, make_page_iterator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class TestGetPasswordData(BaseAWSCommandParamsTest):
@@ -128,3 +139,278 @@ class TestFormattersHandleClosedPipes(unittest.TestCase):
         # we still should have called the flush() on the
         # stream.
         fake_closed_stream.flush.assert_called_with()
+
+
+class TestJSONFormatterSerialization(unittest.TestCase):
+    def setUp(self):
+        self.args = mock.Mock(query=None)
+        self.response = {
+            'Users': [
+                {
+                    'UserName': u'✓',
+                    'Tags': [],
+                    'Attributes': {},
+                    'Nested': {'List': [1, 2.5, [True, None]]},
+                },
+            ],
+        }
+
+    def format_response(self, response):
+        stream = six.StringIO()
+        JSONFormatter(self.args)('command_name', response, stream=stream)
+        return stream.getvalue()
+
+    def expected_output(self, response):
+        return json.dumps(response, indent=4, ensure_ascii=False) + '\n'
+
+    def test_output_matches_stdlib_json(self):
+        self.assertEqual(self.format_response(self.response),
+                         self.expected_output(self.response))
+
+    def test_output_without_orjson(self):
+        with mock.patch.dict('sys.modules', {'orjson': None}):
+            output = self.format_response(self.response)
+        self.assertEqual(output, self.expected_output(self.response))
+
+    def test_response_metadata_is_removed(self):
+        response = {'ResponseMetadata': {'RequestId': 'id'}, 'Foo': 'Bar'}
+        self.assertEqual(self.format_response(response),
+                         self.expected_output({'Foo': 'Bar'}))
+
+    def test_non_dict_response_is_not_modified(self):
+        response = ['ResponseMetadata']
+        self.assertEqual(self.format_response(response),
+                         self.expected_output(response))
+
+    def test_falls_back_for_unsupported_values(self):
+        response = {'Count': 2 ** 70}
+        self.assertEqual(self.format_response(response),
+                         self.expected_output(response))
+
+    def test_floats_match_stdlib_json(self):
+        response = {
+            'Values': [1e16, 1.5e-7, 1e300, -2.5e-10, 0.1, 100.0],
+            'Max': 1e300,
+        }
+        self.assertEqual(self.format_response(response),
+                         self.expected_output(response))
+
+    def test_small_floats_match_stdlib_json(self):
+        # orjson writes these without an exponent.
+        response = {
+            'Values': [1e-05, 5e-05, -1.5e-05, 0.5],
+            'Average': 3.5e-05,
+        }
+        self.assertEqual(self.format_response(response),
+                         self.expected_output(response))
+
+    def test_nan_and_infinity_match_stdlib_json(self):
+        response = {
+            'Values': [float('nan'), float('inf'), float('-inf'), 1.0],
+            'Average': float('nan'),
+        }
+        self.assertEqual(self.format_response(response),
+                         self.expected_output(response))
+
+    @unittest.skipUnless(orjson, 'orjson is not installed')
+    def test_output_is_serialized_with_orjson(self):
+        response = {
+            'Users': [{'UserName': u'✓', 'Tags': [], 'Attributes': {}}],
+            'Nested': {'List': [1, 2.5, [True, False]], 'Key': 'value'},
+        }
+        raw = six.BytesIO()
+        stream = io.TextIOWrapper(raw, encoding='utf-8')
+        with mock.patch.object(JSONFormatter, '_ENCODER') as encoder:
+            JSONFormatter(self.args)('command_name', response, stream=stream)
+        stream.flush()
+        self.assertFalse(encoder.iterencode.called)
+        self.assertFalse(encoder.encode.called)
+        self.assertEqual(raw.getvalue().decode('utf-8'),
+                         self.expected_output(response))
+
+    def test_datetimes_match_stdlib_json(self):
+        tzinfo = datetime.timezone(datetime.timedelta(hours=5, seconds=30))
+        response = {
+            'Created': datetime.datetime(2020, 1, 2, 3, 4, 5, 6,
+                                         tzinfo=tzinfo),
+            'Updated': datetime.datetime(2020, 1, 2, 3, 4, 5),
+        }
+        self.assertEqual(
+            self.format_response(response),
+            json.dumps(response, indent=4, ensure_ascii=False,
+                       default=json_encoder) + '\n')
+
+    def test_deeply_nested_output_matches_stdlib_json(self):
+        response = {'Foo': 'Bar   '}
+        for _ in range(12):
+            response = {'Nested': [response, {'Empty': []}]}
+        self.assertEqual(self.format_response(response),
+                         self.expected_output(response))
+
+    def test_newlines_are_translated(self):
+        raw = six.BytesIO()
+        stream = io.TextIOWrapper(raw, encoding='utf-8', newline='\r\n')
+        with mock.patch('awscli.formatter.os.linesep', '\r\n'):
+            JSONFormatter(self.args)('command_name', self.response,
+                                     stream=stream)
+        stream.flush()
+        output = raw.getvalue().decode('utf-8')
+        self.assertEqual(output.replace('\r\n', '\n'),
+                         self.expected_output(self.response))
+        self.assertNotIn('\n', output.replace('\r\n', ''))
+
+
+class TestStreamedJSONOutput(BaseAWSCommandParamsTest):
+    def setUp(self):
+        super(TestStreamedJSONOutput, self).setUp()
+        self.parsed_responses = [
+            {
+                'Users': [
+                    {'UserName': 'testuser-50', 'Path': '/'},
+                    {'UserName': u'✓', 'Tags': [{'Key': 'a'}]},
+                ],
+                'IsTruncated': True,
+                'Marker': 'marker',
+            },
+            {
+                'Users': [{'UserName': 'testuser-52', 'Path': '/'}],
+                'IsTruncated': False,
+            },
+        ]
+
+    def run_with_output(self, cmdline, output):
+        # Each command consumes (and may modify) the parsed responses, so
+        # every invocation is given its own copy.
+        parsed_responses = self.parsed_responses
+        self.parsed_responses = copy.deepcopy(parsed_responses)
+        stdout = self.run_cmd(
+            '%s --output %s' % (cmdline, output), expected_rc=0)[0]
+        self.parsed_responses = parsed_responses
+        return stdout
+
+    def assert_same_as_json_output(self, cmdline):
+        expected = self.run_with_output(cmdline, 'json')
+        self.assertEqual(self.run_with_output(cmdline, 'json-stream'),
+                         expected)
+
+    def test_paginated_output_matches_json_output(self):
+        self.assert_same_as_json_output('iam list-users')
+
+    def test_empty_result_key_matches_json_output(self):
+        self.parsed_responses = [{'Users': [], 'IsTruncated': False}]
+        self.assert_same_as_json_output('iam list-users')
+
+    def test_truncated_output_matches_json_output(self):
+        self.assert_same_as_json_output('iam list-users --max-items 1')
+
+    def test_multiple_result_keys_match_json_output(self):
+        self.parsed_responses = [
+            {
+                'Contents': [{'Key': 'a'}],
+                'CommonPrefixes': [{'Prefix': 'b/'}],
+                'KeyCount': 2,
+                'Name': 'bucket',
+                'IsTruncated': True,
+                'NextContinuationToken': 'token',
+            },
+            {
+                'Contents': [{'Key': 'c'}],
+                'KeyCount': 1,
+                'Name': 'bucket',
+                'IsTruncated': False,
+            },
+        ]
+        self.assert_same_as_json_output('s3api list-objects-v2 --bucket b')
+
+    def test_primary_key_missing_from_first_page_matches_json_output(self):
+        self.parsed_responses = [
+            {
+                'CommonPrefixes': [{'Prefix': 'b/'}],
+                'KeyCount': 1,
+                'Name': 'bucket',
+                'IsTruncated': True,
+                'NextContinuationToken': 'token',
+            },
+            {
+                'Contents': [{'Key': 'c'}],
+                'CommonPrefixes': [{'Prefix': 'd/'}],
+                'KeyCount': 2,
+                'Name': 'bucket',
+                'IsTruncated': False,
+            },
+        ]
+        self.assert_same_as_json_output(
+            's3api list-objects-v2 --bucket b --delimiter /')
+
+    def test_scalar_items_match_json_output(self):
+        self.parsed_responses = [
+            {'AccountAliases': ['alias-1', u'✓'], 'IsTruncated': True,
+             'Marker': 'marker'},
+            {'AccountAliases': ['alias-3'], 'IsTruncated': False},
+        ]
+        self.assert_same_as_json_output('iam list-account-aliases')
+
+    def test_query_matches_json_output(self):
+        self.assert_same_as_json_output(
+            'iam list-users --query Users[].UserName')
+
+    def test_non_paginated_output_matches_json_output(self):
+        self.parsed_responses = [{'User': {'UserName': 'testuser-50'}}]
+        self.assert_same_as_json_output('iam get-user')
+
+    def test_paginated_output_has_no_response_metadata(self):
+        for page in self.parsed_responses:
+            page['ResponseMetadata'] = {'RequestId': 'request-id'}
+        for output in ('json', 'json-stream'):
+            stdout = self.run_with_output('iam list-users', output)
+            self.assertNotIn('ResponseMetadata', json.loads(stdout))
+
+    def test_output_is_written_per_page(self):
+        output = self.run_with_output('iam list-users', 'json-stream')
+        self.assertEqual(
+            [user['UserName'] for user in json.loads(output)['Users']],
+            ['testuser-50', u'✓', 'testuser-52'])
+        self.assertEqual(len(self.operations_called), 2)
+
+    def test_stream_without_orjson(self):
+        expected = self.run_with_output('iam list-users', 'json')
+        with mock.patch.dict('sys.modules', {'orjson': None}):
+            output = self.run_with_output('iam list-users', 'json-stream')
+        self.assertEqual(output, expected)
+
+
+class TestBufferedJSONOutput(unittest.TestCase):
+    def setUp(self):
+        self.args = mock.Mock(query=None)
+        self.raw = RecordingRawStream()
+        self.response = {
+            'Users': [{'UserName': 'user-%s' % i, 'Path': '/'}
+                      for i in range(100)]
+        }
+
+    def test_paginated_json_stream_output_is_written_once(self):
+        pages = [
+            {'Users': [{'UserName': 'user-%s' % i}], 'IsTruncated': True,
+             'Marker': 'marker-%s' % i}
+            for i in range(3)
+        ]
+        pages[-1]['IsTruncated'] = False
+        del pages[-1]['Marker']
+        stream = io.TextIOWrapper(self.raw, encoding='utf-8',
+                                  write_through=True)
+        StreamedJSONFormatter(self.args)(
+            'list-users', make_page_iterator(pages, ['Users']),
+            stream=stream)
+        self.assertEqual(len(self.raw.writes), 1)
+        self.assertEqual(
+            json.loads(self.raw.getvalue().decode('utf-8')),
+            {'Users': [{'UserName': 'user-%s' % i} for i in range(3)]})
+
+    def test_json_output_to_line_buffered_stream_is_batched(self):
+        stream = io.TextIOWrapper(
+            io.BufferedWriter(self.raw), encoding='utf-8',
+            line_buffering=True)
+        JSONFormatter(self.args)('list-users', self.response, stream=stream)
+        self.assertEqual(len(self.raw.writes), 1)
+        self.assertEqual(
+            json.loads(self.raw.getvalue().decode('utf-8')), self.response)
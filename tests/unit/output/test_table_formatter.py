@@ -425,3 +425,19 @@ class TestTableFormatter(unittest.TestCase):
     def test_jmespath_filtered_dict_response(self):
         self.assert_data_renders_to(data=JMESPATH_FILTERED_RESPONSE_DICT,
                                     table=JMESPATH_FILTERED_RESPONSE_DICT_TABLE)
+
+    def test_group_scalar_keys_from_list(self):
+        headers, more = self.formatter._group_scalar_keys_from_list([
+            {'B': 'b', 'A': 'a', 'Tags': []},
+            {'C': 'c', 'A': 'a', 'Nested': {'Key': 'value'}},
+        ])
+        self.assertEqual(headers, ['A', 'B', 'C'])
+        self.assertEqual(more, ['Nested', 'Tags'])
+
+    def test_group_scalar_keys_from_list_with_empty_element(self):
+        headers, more = self.formatter._group_scalar_keys_from_list([
+            {'Tags': []},
+            [],
+        ])
+        self.assertEqual(headers, [])
+        self.assertEqual(more, ['Tags'])
@@ -13,6 +13,7 @@
 # language governing permissions and limitations under the License.
 from awscli.testutils import BaseAWSCommandParamsTest
 from awscli.testutils import mock, unittest
+import io
 import json
 import os
 import sys
@@ -22,7 +23,11 @@ import locale
 from awscli.compat import six
 from six.moves import cStringIO
 
-from awscli.formatter import Formatter
+from botocore.utils import set_value_from_jmespath
+
+from awscli import text
+from awscli.formatter import Formatter, TextFormatter
+from tests.unit.output import RecordingRawStream, make_page_iterator
 
 
 class TestListUsers(BaseAWSCommandParamsTest):
@@ -75,6 +80,12 @@ class TestListUsers(BaseAWSCommandParamsTest):
             output,
             'ENGINEDEFAULTS\tNone\n')
 
+    def test_text_response_with_query(self):
+        output = self.run_cmd(
+            'iam list-users --output text --query Users[].UserName',
+            expected_rc=0)[0]
+        self.assertEqual(output, 'testuser-50\n')
+
 
 class TestDescribeChangesets(BaseAWSCommandParamsTest):
 
@@ -172,3 +183,95 @@ class TestDefaultStream(BaseAWSCommandParamsTest):
         self.assertEqual(
             formatter.stream.getvalue(),
             u'\u00e9'.encode(locale.getpreferredencoding()))
+
+
+class TestBufferedOutput(unittest.TestCase):
+    def setUp(self):
+        self.args = mock.Mock(query=None)
+        self.raw = RecordingRawStream()
+        self.response = {
+            'Users': [{'UserName': 'user-%s' % i, 'Path': '/'}
+                      for i in range(100)]
+        }
+
+    def paginated_response(self, num_pages):
+        pages = [
+            {'Users': [{'UserName': 'user-%s' % i}], 'IsTruncated': True,
+             'Marker': 'marker-%s' % i}
+            for i in range(num_pages)
+        ]
+        pages[-1]['IsTruncated'] = False
+        del pages[-1]['Marker']
+        return make_page_iterator(pages, ['Users'])
+
+    def unbuffered_stream(self):
+        return io.TextIOWrapper(self.raw, encoding='utf-8',
+                                write_through=True)
+
+    def test_text_output_to_unbuffered_stream_is_batched(self):
+        stream = self.unbuffered_stream()
+        TextFormatter(self.args)('list-users', self.response, stream=stream)
+        self.assertEqual(len(self.raw.writes), 1)
+        self.assertEqual(self.raw.getvalue().count(b'USERS'), 100)
+        # The original stream is still usable after formatting.
+        stream.write(u'done')
+        self.assertTrue(self.raw.getvalue().endswith(b'done'))
+
+    def test_paginated_text_output_is_written_once(self):
+        stream = self.unbuffered_stream()
+        TextFormatter(self.args)(
+            'list-users', self.paginated_response(3), stream=stream)
+        self.assertEqual(len(self.raw.writes), 1)
+        self.assertEqual(
+            self.raw.getvalue(),
+            b'USERS\tuser-0\nUSERS\tuser-1\nUSERS\tuser-2\n')
+
+    def test_paginated_text_output_to_tty_is_flushed_per_page(self):
+        self.raw.is_tty = True
+        stream = self.unbuffered_stream()
+        TextFormatter(self.args)(
+            'list-users', self.paginated_response(3), stream=stream)
+        self.assertEqual(
+            self.raw.writes,
+            [b'USERS\tuser-0\n', b'USERS\tuser-1\n', b'USERS\tuser-2\n'])
+
+
+class TestPaginatedTextOutput(unittest.TestCase):
+    def setUp(self):
+        self.args = mock.Mock(query=None)
+        self.pages = [
+            {'A': ['a-0'], 'C': {'D': ['d-0']}, 'IsTruncated': True,
+             'Marker': 'marker'},
+            {'A': ['a-1'], 'C': {'D': ['d-1']}, 'IsTruncated': False},
+        ]
+
+    def format_pages(self, result_keys):
+        stream = six.StringIO()
+        TextFormatter(self.args)(
+            'list', make_page_iterator(self.pages, result_keys),
+            stream=stream)
+        return stream.getvalue()
+
+    def expected_output(self, page_outputs):
+        expected = six.StringIO()
+        for page_output in page_outputs:
+            text.format_text(page_output, expected)
+        return expected.getvalue()
+
+    def test_simple_and_nested_result_keys(self):
+        self.assertEqual(
+            self.format_pages(['A', 'C.D']),
+            self.expected_output(
+                {'A': page['A'], 'C': page['C']} for page in self.pages))
+
+    def test_result_key_with_trailing_newline(self):
+        # The expression is not a plain identifier, so its value is set
+        # using the full jmespath expression.
+        with mock.patch('awscli.formatter.set_value_from_jmespath',
+                        wraps=set_value_from_jmespath) as set_value:
+            output = self.format_pages(['A\n'])
+        self.assertEqual(
+            output,
+            self.expected_output({'A\n': page['A']} for page in self.pages))
+        self.assertEqual(
+            [c[0][1] for c in set_value.call_args_list], ['A\n', 'A\n'])